@@ -1,15 +1,63 @@
+import argparse
+import asyncio
+import contextvars
+import functools
+import hashlib
+import io
+import json
+import logging
 import os
+import shutil
+import sqlite3
 import subprocess
-from dotenv import load_dotenv
-from colorama import init
-from langchain_openai import ChatOpenAI
-from langchain_community.embeddings import OpenAIEmbeddings
-
-# Init colorama
-init(autoreset=True)
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.rate_limiters import BaseRateLimiter
+from langchain_community.cache import SQLiteCache
+
+# Init colorama (only Windows consoles need the ANSI translation)
+if os.name == "nt" and sys.stdout.isatty():
+    from colorama import init
+    init(autoreset=True)
+
+# Load environment variables from the .env next to this script, wherever it is run from
+ENV_FILE = Path(__file__).with_name(".env")
+if ENV_FILE.exists():
+    from dotenv import load_dotenv
+    load_dotenv(ENV_FILE)
+
+# --- Logging ---
+class BufferedStreamHandler(logging.StreamHandler):
+    # StreamHandler flushes after every record; leave that to the stream's own buffer and only
+    # flush for warnings, errors and records logged with extra={"flush": True} (step headers).
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        if record.levelno >= logging.WARNING or getattr(record, "flush", False):
+            self.flush()
+
+def open_log_stream():
+    # Block-buffered UTF-8 view of stdout (line-buffered on a terminal); fall back to sys.stdout
+    # when it has no real file descriptor
+    try:
+        return open(sys.stdout.fileno(), "w", encoding="utf-8", closefd=False)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return sys.stdout
 
-# Load environment variables
-load_dotenv()
+log = logging.getLogger(__name__)
 
 # --- CONFIG ---
 JIRA_EMAIL = os.getenv("JIRA_EMAIL")
@@ -17,6 +65,19 @@ JIRA_API_TOKEN = os.getenv("JIRA_API_TOKEN")
 JIRA_DOMAIN = os.getenv("JIRA_DOMAIN")
 JIRA_ISSUE_KEY = os.getenv("JIRA_ISSUE_KEY", "KAN-1")  #  CHANGE JIRA ISSUE KEY HERE
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".langchain.db")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".embeddings_cache.db")
+BATCH_POLL_SECONDS = int(os.getenv("BATCH_POLL_SECONDS", "30"))
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+CYPRESS_TEST_PATH = "cypress/e2e/generated_tests.cy.js"
+PLAYWRIGHT_TEST_PATH = "playwright/tests/generated_tests.spec.js"
+SUPERTEST_TEST_PATH = "supertest/tests/generated_tests.spec.js"
+# Resolved once so runners exec npx directly (npx.cmd on Windows) instead of via a shell
+NPX = shutil.which("npx") or "npx"
+# Pin the bundled Electron browser and let only the reporter print, skipping Cypress's own banners
+CYPRESS_RUN_ARGS = ["--browser", "electron", "--headless", "--quiet"]
 
 # Validate required environment variables
 required_vars = ["JIRA_EMAIL", "JIRA_API_TOKEN", "JIRA_DOMAIN", "OPENAI_API_KEY"]
@@ -24,23 +85,196 @@ missing_vars = [var for var in required_vars if not os.getenv(var)]
 if missing_vars:
     raise ValueError(f"Missing required environment variables: {missing_vars}")
 
-# LLM setup
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+# One keep-alive HTTP/2 connection pool per sync/async side, shared by chat, embeddings and
+# batch calls so they reuse connections instead of each paying its own TCP + TLS handshake
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=16, keepalive_expiry=60.0)
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=5.0)  # the OpenAI SDK's default
+http_client = httpx.Client(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+http_async_client = httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+
+# LLM setup (streaming=True still goes through the LLM cache when called via invoke).
+# langchain_openai is imported on first use since it pulls in pydantic models and tiktoken.
+LLM_MODEL = "gpt-4o-mini"
+
+@functools.lru_cache(maxsize=None)
+def get_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model=LLM_MODEL,
+        temperature=0,
+        streaming=True,
+        stream_usage=True,
+        http_client=http_client,
+        http_async_client=http_async_client,
+        rate_limiter=rate_limiter,
+    )
+
+# --- Embeddings ---
+class CachedEmbeddings(Embeddings):
+    # Stores float32 vectors in SQLite keyed by sha256(model + text), so identical text is only
+    # sent to the embeddings API once across runs.
+    def __init__(self, inner, database_path):
+        self.inner = inner
+        self.model = getattr(inner, "model", "")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(database_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB)")
+        self._db.commit()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).digest()
+
+    def _embed(self, texts, embed):
+        keys = [self._key(text) for text in texts]
+        vectors = {}
+        with self._lock:
+            for key in set(keys):
+                row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    vectors[key] = np.frombuffer(row[0], dtype=np.float32)
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            fresh = [np.asarray(v, dtype=np.float32) for v in embed(list(missing.values()))]
+            vectors.update(zip(missing, fresh))
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in zip(missing, fresh)],
+                )
+                self._db.commit()
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_documents(self, texts):
+        return self._embed(texts, self.inner.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], lambda texts: [self.inner.embed_query(texts[0])])[0]
+
+# Embeddings are only needed by the vector store and the semantic cache, so their import is
+# deferred until first use
+@functools.lru_cache(maxsize=None)
+def get_embeddings():
+    from langchain_community.embeddings import OpenAIEmbeddings
+    return CachedEmbeddings(
+        OpenAIEmbeddings(
+            openai_api_key=OPENAI_API_KEY,
+            http_client=http_client,
+            http_async_client=http_async_client,
+        ),
+        EMBEDDING_CACHE_PATH,
+    )
+
+# --- LLM cache ---
+REQUIREMENT_HEADER = "Requirement:\n"  # every generation prompt ends with this header + requirement
+
+def split_cache_prompt(prompt):
+    # The cache sees the messages serialised as JSON; split off the requirement ending the last one
+    try:
+        *history, last = json.loads(prompt)
+        content = last["kwargs"]["content"]
+    except (ValueError, TypeError, KeyError):
+        return None, None
+    if not isinstance(content, str):
+        return None, None
+    instructions, found, requirement = content.rpartition(REQUIREMENT_HEADER)
+    if not found:
+        return None, None
+    return json.dumps(history) + instructions, requirement
+
+class SemanticSQLiteCache(SQLiteCache):
+    # Exact matches are served by SQLiteCache. On a miss, a stored completion is reused when its
+    # instructions are identical and its requirement embedding, from the same embeddings model,
+    # is within `threshold` cosine.
+    def __init__(self, database_path, threshold):
+        super().__init__(database_path=database_path)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(database_path, check_same_thread=False)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(semantic_llm_cache)")}
+        if columns and "embedding_model" not in columns:
+            # Rows written before embeddings were keyed by model can't be compared safely
+            self._db.execute("DROP TABLE semantic_llm_cache")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS semantic_llm_cache (llm TEXT, embedding_model TEXT, "
+            "instructions TEXT, prompt TEXT, embedding BLOB, PRIMARY KEY (llm, embedding_model, prompt))"
+        )
+        self._db.commit()
+
+    def _embed(self, requirement):
+        vector = np.asarray(get_embeddings().embed_query(requirement), dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def lookup(self, prompt, llm_string):
+        cached = super().lookup(prompt, llm_string)
+        if cached is not None:
+            return cached
+        instructions, requirement = split_cache_prompt(prompt)
+        if instructions is None:
+            return None
+        try:
+            embedding_model = get_embeddings().model
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT prompt, embedding FROM semantic_llm_cache "
+                    "WHERE llm = ? AND embedding_model = ? AND instructions = ?",
+                    (llm_string, embedding_model, instructions),
+                ).fetchall()
+            if not rows:
+                return None
+            query = self._embed(requirement)
+        except Exception as e:
+            log.warning(f"⚠️ Semantic cache lookup skipped: {e}")
+            return None
+        # A model may still change its output size, so only compare vectors of the query's size
+        rows = [row for row in rows if len(row[1]) == query.nbytes]
+        if not rows:
+            return None
+        matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+        scores = matrix.reshape(len(rows), -1) @ query
+        best = int(scores.argmax())
+        if scores[best] < self.threshold:
+            return None
+        log.info(f"💾 Reusing a cached completion for a similar requirement (similarity {scores[best]:.3f})")
+        return super().lookup(rows[best][0], llm_string)
+
+    def update(self, prompt, llm_string, return_val):
+        super().update(prompt, llm_string, return_val)
+        instructions, requirement = split_cache_prompt(prompt)
+        if instructions is None:
+            return
+        try:
+            embedding_model = get_embeddings().model
+            embedding = self._embed(requirement)
+        except Exception as e:
+            log.warning(f"⚠️ Semantic cache update skipped: {e}")
+            return
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO semantic_llm_cache VALUES (?, ?, ?, ?, ?)",
+                (llm_string, embedding_model, instructions, prompt, embedding.tobytes()),
+            )
+            self._db.commit()
+
+    def clear(self, **kwargs):
+        super().clear(**kwargs)
+        with self._lock:
+            self._db.execute("DELETE FROM semantic_llm_cache")
+            self._db.commit()
+
+# Reruns against an unchanged (or nearly unchanged) requirement reuse the stored completion
+# instead of calling OpenAI
+set_llm_cache(SemanticSQLiteCache(LLM_CACHE_PATH, SEMANTIC_CACHE_THRESHOLD))
 
 # --- State ---
-class QAState(dict):
+@dataclass(slots=True)
+class QAState:
     requirements: str = ""
     cypress_test_code: str = ""
     playwright_test_code: str = ""
     supertest_test_code: str = ""
 
 # --- Ensure Express app exists for Supertest ---
-def ensure_express_app():
-    app_path = "app.js"
-    if not os.path.exists(app_path):
-        print("📦 Creating minimal Express app for Supertest at app.js...")
-        content = """
+_EXPRESS_APP_SRC = b"""
 const express = require('express');
 const app = express();
 
@@ -56,198 +290,508 @@ app.post('/api/login', (req, res) => {
 
 module.exports = app;
 """
-        with open(app_path, "w") as f:
-            f.write(content)
-        print("✅ Express app created.")
-    else:
-        print("ℹ️ Express app already exists at app.js")
+
+def ensure_express_app():
+    app_path = "app.js"
+    # O_EXCL makes "create only if missing" a single atomic open, with no separate stat
+    try:
+        fd = os.open(app_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)  # same mode as open()
+    except FileExistsError:
+        log.info("ℹ️ Express app already exists at app.js")
+        return
+    log.info("📦 Creating minimal Express app for Supertest at app.js...")
+    try:
+        os.write(fd, _EXPRESS_APP_SRC)
+    finally:
+        os.close(fd)
+    log.info("✅ Express app created.")
 
 # --- Fetch Jira Requirements (placeholder) ---
 def fetch_jira_requirements(state: QAState, domain, issue_key, email, token):
-    print(f"📥 Fetching Jira issue {issue_key} from {domain}...")
-    state["requirements"] = (
+    log.info(f"📥 Fetching Jira issue {issue_key} from {domain}...")
+    state.requirements = (
         "As a user, I want to log into the system using valid credentials "
         "so that I can access my dashboard."
     )
     return state
 
 # --- Vector Store (placeholder) ---
-def create_or_update_vector_store(state: QAState, embeddings):
-    print("📚 Updating vector store with requirements...")
+def create_or_update_vector_store(state: QAState, embeddings=None):
+    # Nothing is embedded yet; fall back to get_embeddings() once it is, so the placeholder
+    # doesn't import the embeddings stack or open its cache on every run
+    log.info("📚 Updating vector store with requirements...")
     return state
 
-# --- Generate Cypress Tests ---
-def generate_cypress_tests(state: QAState):
-    prompt = f"""
-Convert the following Jira requirement into comprehensive Cypress test code
-
-Requirement:
-{state['requirements']}
-
-Generate Cypress JavaScript code that:
-
-1. Includes proper describe() and it() blocks
-2. Has appropriate test data setup
-3. Includes assertions for the requirements
-4. Handles common web elements (forms, buttons, etc.)
-5. Includes proper wait conditions
-6. Uses cy.visit() to navigate to a test URL (use 'https://the-internet.herokuapp.com/login' as placeholder)
-7. Includes both positive and negative test cases for login functionality
-8. Uses realistic selectors and test data
-9. Add cy.wait(3000) after form submission to handle slow responses
-10. Uses proper waits and assertions with timeout: 10000
-11. Checks for success redirect to /secure page
-12. Checks for error flash messages
-13. valid username: tomsmith and password: SuperSecretPassword!.
-
-Output only valid Cypress JavaScript code without markdown formatting.
-"""
+# --- Prompts ---
+# The shared system message and static instructions come first and the Jira requirement
+# last, so every call shares an identical prefix that OpenAI's prompt caching can reuse.
+CYPRESS_MARKER = "===CYPRESS==="
+PLAYWRIGHT_MARKER = "===PLAYWRIGHT==="
+
+SYSTEM_PROMPT = """You convert Jira requirements into comprehensive JavaScript tests.
+Every test file:
+- covers positive and negative login cases with realistic selectors and test data
+- uses the valid credentials username tomsmith, password SuperSecretPassword!
+- asserts exactly what the requirement asks for
+- is output as valid JavaScript code only, without markdown formatting"""
+
+# Cypress and Playwright are generated in one call so the shared instructions
+# and requirement are only sent (and billed) once.
+UI_TEST_PROMPT = """Write a Cypress spec and a Playwright spec for the requirement below.
+Both specs navigate to 'https://the-internet.herokuapp.com/login' (placeholder), wait and assert
+with timeout: 10000, check the redirect to /secure on success and the error flash message on failure.
+Cypress: describe()/it() blocks, cy.visit(), cy.wait(3000) after submitting the form.
+Playwright: @playwright/test with test.describe()/test() blocks.
+Output a line containing {cypress_marker} followed by the Cypress code,
+then a line containing {playwright_marker} followed by the Playwright code, and nothing else.
+
+""" + REQUIREMENT_HEADER + "{requirements}"
+
+SUPERTEST_PROMPT = """Write a Supertest + Jest spec for the requirement below.
+Test the RESTful login endpoint POST /api/login (placeholder) without expect(response.body) assertions.
+Import the Express app from '../../app' (correct path relative to supertest/tests).
+
+""" + REQUIREMENT_HEADER + "{requirements}"
+
+def build_prompt(template, state: QAState):
+    return template.format(
+        requirements=state.requirements,
+        cypress_marker=CYPRESS_MARKER,
+        playwright_marker=PLAYWRIGHT_MARKER,
+    )
+
+# --- Stream LLM tokens to disk ---
+class StreamingFileWriter(BaseCallbackHandler):
+    # Writes tokens to `path` as they arrive and switches file whenever one of
+    # `markers` ({marker: path}) shows up in the stream. Write errors abort the call instead of
+    # being logged and swallowed by LangChain, which would leave a stale or half-written spec.
+    run_inline = True
+    raise_error = True
+
+    def __init__(self, path, markers=None):
+        self.path = path
+        self.markers = markers or {}
+        self.holdback = max((len(marker) for marker in self.markers), default=1) - 1
+        self.pending = ""
+        self.files = {}
+        self.written = set()
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.pending += token
+        while True:
+            found = [(self.pending.find(m), m) for m in self.markers if m in self.pending]
+            if not found:
+                break
+            index, marker = min(found)
+            self._write(self.pending[:index])
+            self.path = self.markers[marker]
+            self.pending = self.pending[index + len(marker):]
+        # Hold back a tail that could be the start of a marker split across tokens
+        cut = len(self.pending) - self.holdback
+        if cut > 0:
+            self._write(self.pending[:cut])
+            self.pending = self.pending[cut:]
+
+    def _write(self, text):
+        if not text:
+            return
+        f = self.files.get(self.path)
+        if f is None:
+            f = self.files[self.path] = open(self.path, "w", encoding="utf-8")
+            self.written.add(self.path)
+        f.write(text)
+        f.flush()
+
+    def close(self, flush=True):
+        # Returns the paths that received streamed content
+        pending, self.pending = self.pending, ""
+        try:
+            if flush:
+                self._write(pending)
+        finally:
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+        return self.written
+
+# --- Track token usage and prompt-cache hits ---
+PROMPT_CACHE_MIN_TOKENS = 1024  # OpenAI only caches prompts at least this long
+
+class TokenUsageLogger(BaseCallbackHandler):
+    # Logs prompt tokens per call and how many of them OpenAI served from its prompt cache
+    run_inline = True
+
+    def __init__(self, name):
+        self.name = name
+        self.streamed = False
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.streamed = True
+
+    def on_llm_end(self, response, **kwargs):
+        if not self.streamed:
+            log.info(f"💾 {self.name}: served from the local LLM cache")
+            return
+        usage = getattr(response.generations[0][0].message, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens", 0)
+        if not prompt_tokens:
+            return
+        cached_tokens = usage.get("input_token_details", {}).get("cache_read", 0)
+        hit_ratio = cached_tokens / prompt_tokens
+        log.info(f"📊 {self.name}: {prompt_tokens} prompt tokens, {cached_tokens} cached ({hit_ratio:.0%})")
+        if prompt_tokens >= PROMPT_CACHE_MIN_TOKENS and hit_ratio < 0.5:
+            log.warning(f"⚠️ {self.name}: low prompt-cache hit ratio, check the static prompt prefix for drift")
+
+# --- Rate limiting ---
+# Messages of the call in flight on this task, so the limiter can size it by prompt tokens
+_pending_messages = contextvars.ContextVar("pending_messages", default=())
+
+@functools.lru_cache(maxsize=None)
+def _prompt_encoding():
+    import tiktoken
     try:
-        response = llm.invoke(prompt)
-        state["cypress_test_code"] = response.content
-        print("✅ Generated Cypress test code")
-    except Exception as e:
-        print(f"❌ Error generating Cypress tests: {e}")
-        state["cypress_test_code"] = f"// Error generating tests: {e}"
-    return state
+        return tiktoken.encoding_for_model(LLM_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
 
-# --- Generate Playwright Tests ---
-def generate_playwright_tests(state: QAState):
-    prompt = f"""
-Convert the following Jira requirement into comprehensive Playwright test code
-
-Requirement:
-{state['requirements']}
-
-Generate Playwright JavaScript code that:
-
-1. Uses @playwright/test
-2. Includes proper test.describe() and test() blocks
-3. Has appropriate test data setup
-4. Includes assertions for the requirements
-5. Handles common web elements (forms, buttons, etc.)
-6. Navigates to 'https://the-internet.herokuapp.com/login' as placeholder
-7. Includes both positive and negative test cases for login functionality
-8. Uses realistic selectors and test data
-9. Adds proper waits and timeout: 10000
-10. Checks for success redirect to /secure page
-11. Checks for error flash messages
-12. valid username: tomsmith and password: SuperSecretPassword!.
-
-Output only valid Playwright JavaScript code without markdown formatting.
-"""
+def count_prompt_tokens(messages):
     try:
-        response = llm.invoke(prompt)
-        state["playwright_test_code"] = response.content
-        print("✅ Generated Playwright test code")
+        encoding = _prompt_encoding()
+    except Exception:
+        return sum(len(m.content) for m in messages) // 4  # rough estimate if tiktoken is unavailable
+    return sum(len(encoding.encode(m.content)) for m in messages)
+
+class RateLimiter(BaseRateLimiter):
+    # Token bucket over requests and tokens per minute, refilled continuously. ChatOpenAI calls
+    # it only after the LLM cache misses, so calls that really reach OpenAI wait here for
+    # capacity instead of tripping 429s and OpenAI's retry backoff.
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        if requests_per_minute <= 0 or tokens_per_minute <= 0:
+            raise ValueError("OPENAI_RPM_LIMIT and OPENAI_TPM_LIMIT must be positive")
+        self.max_requests = requests_per_minute
+        self.max_tokens = tokens_per_minute
+        self.available_requests = requests_per_minute
+        self.available_tokens = tokens_per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        self.available_requests = min(
+            self.max_requests, self.available_requests + elapsed * self.max_requests / 60
+        )
+        self.available_tokens = min(
+            self.max_tokens, self.available_tokens + elapsed * self.max_tokens / 60
+        )
+
+    def _take(self, tokens):
+        # Takes capacity for one call and returns 0, or returns how long to wait before retrying
+        tokens = min(tokens, self.max_tokens)
+        with self._lock:
+            self._refill()
+            if self.available_requests >= 1 and self.available_tokens >= tokens:
+                self.available_requests -= 1
+                self.available_tokens -= tokens
+                return 0
+            return max(
+                (1 - self.available_requests) * 60 / self.max_requests,
+                (tokens - self.available_tokens) * 60 / self.max_tokens,
+            )
+
+    def acquire(self, *, blocking=True):
+        tokens = count_prompt_tokens(_pending_messages.get())
+        while wait := self._take(tokens):
+            if not blocking:
+                return False
+            time.sleep(wait)
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        # tiktoken may download its encoding on first use, so count off the event loop
+        tokens = await asyncio.to_thread(count_prompt_tokens, _pending_messages.get())
+        while wait := self._take(tokens):
+            if not blocking:
+                return False
+            await asyncio.sleep(wait)
+        return True
+
+rate_limiter = RateLimiter(OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT)
+
+async def ainvoke_throttled(messages, config):
+    _pending_messages.set(messages)
+    return await get_llm().ainvoke(messages, config=config)
+
+# --- Generate Cypress + Playwright Tests ---
+def split_ui_tests(content):
+    cypress_code, found, playwright_code = content.partition(PLAYWRIGHT_MARKER)
+    if not found:
+        raise ValueError(f"response is missing the {PLAYWRIGHT_MARKER} section")
+    cypress_code = cypress_code.replace(CYPRESS_MARKER, "", 1).strip()
+    playwright_code = playwright_code.strip()
+    if not cypress_code or not playwright_code:
+        raise ValueError("response has an empty Cypress or Playwright section")
+    return cypress_code, playwright_code
+
+async def generate_ui_tests(state: QAState):
+    writer = StreamingFileWriter(
+        CYPRESS_TEST_PATH,
+        {CYPRESS_MARKER: CYPRESS_TEST_PATH, PLAYWRIGHT_MARKER: PLAYWRIGHT_TEST_PATH},
+    )
+    try:
+        response = await ainvoke_throttled(
+            [
+                SystemMessage(content=SYSTEM_PROMPT),
+                HumanMessage(content=build_prompt(UI_TEST_PROMPT, state)),
+            ],
+            config={"callbacks": [writer, TokenUsageLogger("Cypress + Playwright")]},
+        )
+        written = writer.close()
+        state.cypress_test_code, state.playwright_test_code = split_ui_tests(response.content)
+        log.info("✅ Generated Cypress and Playwright test code")
     except Exception as e:
-        print(f"❌ Error generating Playwright tests: {e}")
-        state["playwright_test_code"] = f"// Error generating Playwright tests: {e}"
+        writer.close(flush=False)
+        written = set()  # anything streamed before the failure is overwritten below
+        log.error(f"❌ Error generating Cypress and Playwright tests: {e}")
+        state.cypress_test_code = f"// Error generating tests: {e}"
+        state.playwright_test_code = f"// Error generating Playwright tests: {e}"
+    # Cache hits, failures and empty sections stream nothing to a file, so write its final code
+    # in one go rather than leaving the previous run's spec in place
+    for name, test_path, save in (
+        ("Cypress", CYPRESS_TEST_PATH, save_cypress_tests),
+        ("Playwright", PLAYWRIGHT_TEST_PATH, save_playwright_tests),
+    ):
+        if test_path in written:
+            log.info(f"✅ {name} test streamed to {test_path}")
+        else:
+            save(state)
     return state
 
 # --- Generate Supertest Tests ---
-def generate_supertest_tests(state: QAState):
-    prompt = f"""
-Convert the following Jira requirement into comprehensive API test code using Supertest + Jest.
-
-Requirement:
-{state['requirements']}
-
-Generate Node.js test code that:
-
-1. Uses Supertest with Jest.
-2. Tests a RESTful login endpoint at POST /api/login (placeholder).
-3. Includes positive and negative test case with valid username (tomsmith) and password (SuperSecretPassword!) and no  expect(response.body) assertions.
-4. Import the Express app from '../../app' (correct path relative to supertest/tests)
-5. Export only valid JavaScript code without markdown formatting.
-"""
+async def generate_supertest_tests(state: QAState):
+    writer = StreamingFileWriter(SUPERTEST_TEST_PATH)
     try:
-        response = llm.invoke(prompt)
-        state["supertest_test_code"] = response.content
-        print("✅ Generated Supertest test code")
+        response = await ainvoke_throttled(
+            [
+                SystemMessage(content=SYSTEM_PROMPT),
+                HumanMessage(content=build_prompt(SUPERTEST_PROMPT, state)),
+            ],
+            config={"callbacks": [writer, TokenUsageLogger("Supertest")]},
+        )
+        written = writer.close()
+        state.supertest_test_code = response.content
+        log.info("✅ Generated Supertest test code")
     except Exception as e:
-        print(f"❌ Error generating Supertest tests: {e}")
-        state["supertest_test_code"] = f"// Error generating Supertest tests: {e}"
+        writer.close(flush=False)
+        written = set()  # anything streamed before the failure is overwritten below
+        log.error(f"❌ Error generating Supertest tests: {e}")
+        state.supertest_test_code = f"// Error generating Supertest tests: {e}"
+    if SUPERTEST_TEST_PATH in written:
+        log.info(f"✅ Supertest test streamed to {SUPERTEST_TEST_PATH}")
+    else:
+        save_supertest_tests(state)
     return state
 
-# --- Save & Run Cypress ---
-def save_and_run_cypress_tests(state: QAState):
-    test_path = "cypress/e2e/generated_tests.cy.js"
-    os.makedirs(os.path.dirname(test_path), exist_ok=True)
-    with open(test_path, "w") as f:
-        f.write(state.get("cypress_test_code", "// No Cypress test code"))
-    print(f"✅ Cypress test saved to {test_path}")
+# --- Generate all tests via the OpenAI Batch API ---
+def _batch_request(custom_id, prompt):
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": LLM_MODEL,
+            "temperature": 0,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+        },
+    }
+
+def generate_tests_batch(state: QAState):
+    # Half the token price of real-time calls, at the cost of up to 24h turnaround
+    from openai import OpenAI
+
     try:
-        subprocess.run(["npx", "cypress", "run", "--spec", test_path], check=True, shell=True)
-        print("✅ Cypress tests executed successfully")
+        client = OpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+        requests_jsonl = "\n".join(
+            json.dumps(_batch_request(custom_id, build_prompt(template, state)))
+            for custom_id, template in (("ui", UI_TEST_PROMPT), ("supertest", SUPERTEST_PROMPT))
+        )
+        batch_file = client.files.create(
+            file=("qa_tests_batch.jsonl", requests_jsonl.encode("utf-8")), purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        log.info(f"📨 Submitted batch {batch.id}, polling every {BATCH_POLL_SECONDS}s...", extra={"flush": True})
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(BATCH_POLL_SECONDS)
+            batch = client.batches.retrieve(batch.id)
+        if batch.status != "completed" or not batch.output_file_id:
+            raise RuntimeError(f"batch {batch.id} ended with status {batch.status}")
+        results = {}
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            item = json.loads(line)
+            if item.get("response") and item["response"]["status_code"] == 200:
+                results[item["custom_id"]] = item["response"]["body"]["choices"][0]["message"]["content"]
     except Exception as e:
-        print(f"❌ Error running Cypress tests: {e}")
-
-# --- Save & Run Playwright ---
-def save_and_run_playwright_tests(state: QAState):
-    test_path = "playwright/tests/generated_tests.spec.js"
-    os.makedirs(os.path.dirname(test_path), exist_ok=True)
-    with open(test_path, "w") as f:
-        f.write(state.get("playwright_test_code", "// No Playwright test code"))
-    print(f"✅ Playwright test saved to {test_path}")
+        log.error(f"❌ Error generating tests via the Batch API: {e}")
+        results = {}
+
     try:
-        subprocess.run(["npx", "playwright", "test", test_path], check=True, shell=True)
-        print("✅ Playwright tests executed successfully")
+        if "ui" not in results:
+            raise ValueError("no result in batch output")
+        state.cypress_test_code, state.playwright_test_code = split_ui_tests(results["ui"])
+        log.info("✅ Generated Cypress and Playwright test code")
     except Exception as e:
-        print(f"❌ Error running Playwright tests: {e}")
-
-# --- Save & Run Supertest ---
-def save_and_run_supertest_tests(state: QAState):
-    test_path = "supertest/tests/generated_tests.spec.js"
-    os.makedirs(os.path.dirname(test_path), exist_ok=True)
-    with open(test_path, "w") as f:
-        f.write(state.get("supertest_test_code", "// No Supertest test code"))
-    print(f"✅ Supertest test saved to {test_path}")
+        log.error(f"❌ Error generating Cypress and Playwright tests: {e}")
+        state.cypress_test_code = f"// Error generating tests: {e}"
+        state.playwright_test_code = f"// Error generating Playwright tests: {e}"
+    if "supertest" in results:
+        state.supertest_test_code = results["supertest"]
+        log.info("✅ Generated Supertest test code")
+    else:
+        log.error("❌ Error generating Supertest tests: no result in batch output")
+        state.supertest_test_code = "// Error generating Supertest tests: no result in batch output"
+    save_cypress_tests(state)
+    save_playwright_tests(state)
+    save_supertest_tests(state)
+    return state
+
+# --- Write test file ---
+def write_test_file(test_path, code):
+    # Encode once and write bytes in a single call, with no text-mode wrapper or buffered file object
+    Path(test_path).write_bytes(code.encode("utf-8"))
+
+# --- Save Cypress ---
+def save_cypress_tests(state: QAState):
+    test_path = CYPRESS_TEST_PATH
+    write_test_file(test_path, state.cypress_test_code or "// No Cypress test code")
+    log.info(f"✅ Cypress test saved to {test_path}")
+    return test_path
+
+# --- Save Playwright ---
+def save_playwright_tests(state: QAState):
+    test_path = PLAYWRIGHT_TEST_PATH
+    write_test_file(test_path, state.playwright_test_code or "// No Playwright test code")
+    log.info(f"✅ Playwright test saved to {test_path}")
+    return test_path
+
+# --- Save Supertest ---
+def save_supertest_tests(state: QAState):
+    test_path = SUPERTEST_TEST_PATH
+    write_test_file(test_path, state.supertest_test_code or "// No Supertest test code")
+    log.info(f"✅ Supertest test saved to {test_path}")
+    return test_path
+
+# --- Run tests ---
+def run_tests(name, cmd):
+    # Output is captured per runner and reported as one block, so parallel runs don't interleave
     try:
-        subprocess.run(["npx", "jest", test_path], check=True, shell=True)
-        print("✅ Supertest tests executed successfully")
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
     except Exception as e:
-        print(f"❌ Error running Supertest tests: {e}")
+        return name, None, str(e)
+    return name, result.returncode, result.stdout
+
+def report_test_run(name, returncode, output):
+    if returncode is None:
+        log.error(f"❌ Error running {name} tests: {output}")
+        return
+    log.info(f"\n----- {name} output -----\n{output.rstrip()}")
+    if returncode == 0:
+        log.info(f"✅ {name} tests executed successfully")
+    else:
+        log.error(f"❌ Error running {name} tests: exit code {returncode}")
+
+# --- Run workflow ---
+# The three runners write to separate directories and share no state, so they run side by side
+TEST_COMMANDS = {
+    "Cypress": [NPX, "cypress", "run", "--spec", CYPRESS_TEST_PATH, *CYPRESS_RUN_ARGS],
+    "Playwright": [NPX, "playwright", "test", PLAYWRIGHT_TEST_PATH],
+    "Supertest": [NPX, "jest", SUPERTEST_TEST_PATH],
+}
+
+async def run_and_report(pool, name):
+    log.info(f"\n⚡ Starting {name} tests...", extra={"flush": True})
+    loop = asyncio.get_running_loop()
+    report_test_run(*await loop.run_in_executor(pool, run_tests, name, TEST_COMMANDS[name]))
+
+async def generate_and_run(pool, generate, state: QAState, names):
+    # Each runner starts as soon as its own spec is written, overlapping the other LLM call
+    await generate(state)
+    await asyncio.gather(*(run_and_report(pool, name) for name in names))
+
+async def run_workflow(state: QAState, batch=False):
+    # The vector store only reads the requirements, so refresh it while the tests are generated
+    log.info("\n2️⃣ Updating vector store in the background...", extra={"flush": True})
+    vector_store_task = asyncio.create_task(
+        asyncio.to_thread(create_or_update_vector_store, state)
+    )
+
+    with ThreadPoolExecutor(max_workers=len(TEST_COMMANDS)) as pool:
+        if batch:
+            log.info("\n3️⃣ Generating tests via the OpenAI Batch API (may take up to 24h)...", extra={"flush": True})
+            await asyncio.to_thread(generate_tests_batch, state)
+            await asyncio.gather(*(run_and_report(pool, name) for name in TEST_COMMANDS))
+        else:
+            log.info("\n3️⃣ Generating Cypress + Playwright and Supertest tests concurrently...", extra={"flush": True})
+            await asyncio.gather(
+                generate_and_run(pool, generate_ui_tests, state, ("Cypress", "Playwright")),
+                generate_and_run(pool, generate_supertest_tests, state, ("Supertest",)),
+            )
+
+    await vector_store_task
+    return state
 
 # --- Main ---
 if __name__ == "__main__":
-    print("🚀 QA Test Workflow: Cypress, Playwright, Supertest sequentially")
+    parser = argparse.ArgumentParser(description="Generate and run AI-written Cypress, Playwright and Supertest tests")
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="generate tests through the OpenAI Batch API (half price, up to 24h turnaround) for non-interactive runs",
+    )
+    args = parser.parse_args()
+
+    log_handler = BufferedStreamHandler(open_log_stream())
+    log_handler.setFormatter(logging.Formatter("%(message)s"))
+    # Only this script's status lines go to the handler; the root logger stays untouched so
+    # httpx and friends don't add a line per OpenAI request at INFO
+    log.addHandler(log_handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+    log.info("🚀 QA Test Workflow: Cypress, Playwright and Supertest in parallel")
 
     state = QAState()
 
+    # Spec directories are created once here; the writers assume they exist
+    for test_path in (CYPRESS_TEST_PATH, PLAYWRIGHT_TEST_PATH, SUPERTEST_TEST_PATH):
+        os.makedirs(os.path.dirname(test_path), exist_ok=True)
+
     # Ensure Express app exists for Supertest
     ensure_express_app()
 
-    print("\n1️⃣ Fetching Jira requirements...")
+    log.info("\n1️⃣ Fetching Jira requirements...", extra={"flush": True})
     state = fetch_jira_requirements(state, JIRA_DOMAIN, JIRA_ISSUE_KEY, JIRA_EMAIL, JIRA_API_TOKEN)
 
-    print("\n2️⃣ Creating vector store...")
-    create_or_update_vector_store(state, embeddings)
-
-    print("\n3️⃣ Generating Cypress tests...")
-    state = generate_cypress_tests(state)
-
-    print("\n4️⃣ Generating Playwright tests...")
-    state = generate_playwright_tests(state)
-
-    print("\n5️⃣ Generating Supertest tests...")
-    state = generate_supertest_tests(state)
-
-    print("\n⚡ Running Cypress tests first...")
-    save_and_run_cypress_tests(state)
-
-    print("\n⚡ Running Playwright tests next...")
-    save_and_run_playwright_tests(state)
-
-    print("\n⚡ Running Supertest tests last...")
-    save_and_run_supertest_tests(state)
-
-    print("\n🎉 Workflow completed!")
-    print("\n🔍 Next steps:")
-    print("   • Cypress: check cypress/e2e/generated_tests.cy.js")
-    print("   • Playwright: check playwright/tests/generated_tests.spec.js")
-    print("   • Supertest: check supertest/tests/generated_tests.spec.js")
-    print("   • Run manually if needed:")
-    print("     - npx cypress run --spec cypress/e2e/generated_tests.cy.js")
-    print("     - npx playwright test playwright/tests/generated_tests.spec.js")
-    print("     - npx jest supertest/tests/generated_tests.spec.js")
+    state = asyncio.run(run_workflow(state, batch=args.batch))
+
+    log.info("\n🎉 Workflow completed!")
+    log.info("\n🔍 Next steps:")
+    log.info("   • Cypress: check cypress/e2e/generated_tests.cy.js")
+    log.info("   • Playwright: check playwright/tests/generated_tests.spec.js")
+    log.info("   • Supertest: check supertest/tests/generated_tests.spec.js")
+    log.info("   • Run manually if needed:")
+    log.info("     - npx cypress run --spec cypress/e2e/generated_tests.cy.js")
+    log.info("     - npx playwright test playwright/tests/generated_tests.spec.js")
+    log.info("     - npx jest supertest/tests/generated_tests.spec.js")
+    log_handler.flush()